@@ -6,10 +6,12 @@ import json
 import datetime
 import random
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.document_loaders import DirectoryLoader, TextLoader
+from config import (
+    DATA_DIR, PROFILE_FILE, RESOURCES_FILE, KNOWLEDGE_DIR, DB_DIR, ONNX_DIR,
+    EMBEDDING_BACKEND, EMBEDDING_CACHE_SIZE, EMBEDDING_THREADS, READ_ONLY
+)
+from query_embeddings import create_embeddings
+from vector_store import get_vector_store
 
 # Configure logging
 logging.basicConfig(
@@ -25,13 +27,6 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Constants
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-PROFILE_FILE = os.path.join(DATA_DIR, "profile.json")
-RESOURCES_FILE = os.path.join(DATA_DIR, "resources.json")
-KNOWLEDGE_DIR = os.path.join(DATA_DIR, "knowledge")
-DB_DIR = os.path.join(DATA_DIR, "chroma_db")
-
 # Create data directories if they don't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
@@ -71,208 +66,22 @@ except Exception as e:
 
 # Initialize embeddings and vector store
 vector_store = None
+embedding_backend = None
 try:
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    # Function to initialize or load the vector store
-    def get_vector_store():
-        if os.path.exists(DB_DIR) and len(os.listdir(DB_DIR)) > 0:
-            # Load existing vector store
-            logger.info("Loading existing vector store")
-            return Chroma(persist_directory=DB_DIR, embedding_function=embeddings)
-        else:
-            # Initialize and populate vector store with mental health resources
-            logger.info("Initializing new vector store")
-            if not os.path.exists(KNOWLEDGE_DIR) or len(os.listdir(KNOWLEDGE_DIR)) == 0:
-                # Create sample knowledge files if directory is empty
-                create_sample_knowledge_files()
-            
-            # Load documents
-            loader = DirectoryLoader(KNOWLEDGE_DIR, glob="**/*.txt", loader_cls=TextLoader)
-            documents = loader.load()
-            
-            # Split text into chunks
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            chunks = text_splitter.split_documents(documents)
-            
-            # Create vector store
-            vectorstore = Chroma.from_documents(
-                documents=chunks,
-                embedding=embeddings, 
-                persist_directory=DB_DIR
-            )
-            vectorstore.persist()
-            return vectorstore
+    embeddings, embedding_backend = create_embeddings(
+        EMBEDDING_BACKEND,
+        cache_size=EMBEDDING_CACHE_SIZE,
+        onnx_dir=ONNX_DIR,
+        num_threads=EMBEDDING_THREADS
+    )
     
     # Initialize vector store
-    vector_store = get_vector_store()
+    vector_store = get_vector_store(embeddings, read_only=READ_ONLY, backend=embedding_backend)
     logger.info("Vector store initialized successfully")
 except Exception as e:
     logger.error(f"Error initializing vector store: {str(e)}")
     vector_store = None
 
-# Create sample knowledge files for the vector store
-def create_sample_knowledge_files():
-    logger.info("Creating sample knowledge files")
-    sample_files = {
-        "anxiety.txt": """
-Anxiety is a normal and often healthy emotion. However, when a person regularly feels disproportionate levels of anxiety, it might become a medical disorder.
-
-Common anxiety symptoms include:
-- Feeling nervous, restless or tense
-- Having a sense of impending danger, panic or doom
-- Having an increased heart rate
-- Breathing rapidly (hyperventilation)
-- Sweating
-- Trembling
-- Feeling weak or tired
-- Trouble concentrating
-- Having trouble sleeping
-- Experiencing gastrointestinal (GI) problems
-
-Self-help techniques for anxiety:
-1. Deep breathing exercises
-2. Progressive muscle relaxation
-3. Mindfulness meditation
-4. Regular physical exercise
-5. Adequate sleep
-6. Limiting caffeine and alcohol
-7. Maintaining a healthy diet
-8. Journaling
-9. Social connection and support
-        """,
-        "depression.txt": """
-Depression is a common and serious medical illness that negatively affects how you feel, think, and act. It causes feelings of sadness and/or a loss of interest in activities you once enjoyed.
-
-Common symptoms of depression include:
-- Feeling sad or having a depressed mood
-- Loss of interest or pleasure in activities once enjoyed
-- Changes in appetite (weight loss or gain)
-- Trouble sleeping or sleeping too much
-- Loss of energy or increased fatigue
-- Increase in purposeless physical activity or slowed movements
-- Feeling worthless or guilty
-- Difficulty thinking, concentrating or making decisions
-- Thoughts of death or suicide
-
-Self-help strategies for depression:
-1. Set attainable goals
-2. Engage in activities that may make you feel better
-3. Exercise regularly
-4. Try to spend time with others
-5. Postpone important decisions until depression improves
-6. Discuss decisions with trusted friends or family
-7. Expect your mood to improve gradually, not immediately
-8. Develop a routine, especially for sleep
-9. Continue educating yourself about depression
-        """,
-        "stress_management.txt": """
-Stress management refers to techniques and psychotherapies aimed at controlling a person's level of stress for improving everyday functioning.
-
-Effects of chronic stress:
-- Anxiety
-- Depression
-- Digestive problems
-- Headaches
-- Heart disease
-- Sleep problems
-- Weight gain
-- Memory and concentration impairment
-
-Effective stress management techniques:
-1. Physical activity (30 minutes of exercise most days)
-2. Relaxation techniques (deep breathing, meditation, yoga, tai chi)
-3. Connecting with others (social support)
-4. Time management strategies
-5. Setting boundaries
-6. Practicing self-care
-7. Getting enough sleep
-8. Seeking professional help when needed
-9. Keeping a stress diary to identify stressors
-        """,
-        "sleep_hygiene.txt": """
-Sleep hygiene refers to the habits and practices that are conducive to sleeping well on a regular basis.
-
-Good sleep hygiene practices:
-1. Maintain a consistent sleep schedule (go to bed and wake up at the same time)
-2. Create a relaxing bedtime routine
-3. Ensure your bedroom is quiet, dark, and cool
-4. Use a comfortable mattress and pillows
-5. Limit exposure to screens before bedtime
-6. Avoid caffeine, alcohol, and large meals close to bedtime
-7. Regular physical activity during the day
-8. Manage worries (journaling before bed can help)
-9. Limit daytime naps to 20-30 minutes
-
-Poor sleep can contribute to:
-- Decreased cognitive function
-- Mood disturbances
-- Increased risk of accidents
-- Weakened immune system
-- Higher risk of health problems like heart disease and diabetes
-        """,
-        "mindfulness.txt": """
-Mindfulness is the psychological process of bringing one's attention to experiences occurring in the present moment, which can be developed through meditation and other training.
-
-Benefits of mindfulness practice:
-- Reduced stress and anxiety
-- Improved focus and attention
-- Better emotional regulation
-- Enhanced self-awareness
-- Improved relationship satisfaction
-- Increased immune functioning
-- Reduced rumination
-- Improved memory and cognitive flexibility
-
-Mindfulness techniques:
-1. Mindful breathing: Focus on the sensation of breath entering and leaving the body
-2. Body scan meditation: Systematically focus attention on different parts of the body
-3. Mindful eating: Pay close attention to the sensory experience of eating
-4. Walking meditation: Bring awareness to each step and breath while walking
-5. Mindful observation: Choose an object and focus on observing it for a few minutes
-6. Mindful listening: Close your eyes and notice all the sounds around you
-7. Thought labeling: Observe thoughts as they arise and label them
-        """,
-        "crisis_resources.txt": """
-Crisis Resources for Mental Health Emergencies:
-
-1. 988 Suicide & Crisis Lifeline
-   - Call or text 988
-   - Available 24/7
-   - Provides free and confidential support for people in distress
-
-2. Crisis Text Line
-   - Text HOME to 741741
-   - Available 24/7
-   - Trained crisis counselors provide support via text message
-
-3. Emergency Services
-   - Call 911 for immediate emergencies
-   - Go to the nearest emergency room
-   - Contact local urgent psychiatric care services
-
-Warning signs that indicate someone may need immediate help:
-- Talking about wanting to die or kill oneself
-- Looking for ways to kill oneself
-- Talking about feeling hopeless or having no purpose
-- Talking about feeling trapped or being in unbearable pain
-- Talking about being a burden to others
-- Increasing alcohol or drug use
-- Acting anxious, agitated, or reckless
-- Sleeping too little or too much
-- Withdrawing or feeling isolated
-- Showing rage or talking about seeking revenge
-- Displaying extreme mood swings
-        """
-    }
-    
-    for filename, content in sample_files.items():
-        file_path = os.path.join(KNOWLEDGE_DIR, filename)
-        with open(file_path, 'w') as file:
-            file.write(content)
-    
-    logger.info(f"Created {len(sample_files)} sample knowledge files")
-
 # Initialize default resources and profile if they don't exist
 def init_resources():
     if not os.path.exists(RESOURCES_FILE):
@@ -312,9 +121,10 @@ def init_profile():
         with open(PROFILE_FILE, 'w') as f:
             json.dump(profile, f, indent=2)
 
-# Initialize default data
-init_resources()
-init_profile()
+# Initialize default data (skipped for read-only batch replay workers)
+if not READ_ONLY:
+    init_resources()
+    init_profile()
 
 # Helper function to read user profile
 def get_profile():
@@ -322,6 +132,8 @@ def get_profile():
         if os.path.exists(PROFILE_FILE):
             with open(PROFILE_FILE, 'r') as f:
                 return json.load(f)
+        elif READ_ONLY:
+            return {}
         else:
             init_profile()
             with open(PROFILE_FILE, 'r') as f:
@@ -416,9 +228,10 @@ def extract_user_info(message):
     return user_info
 
 # Fallback response generation without using the model
-def generate_fallback_response(message, history=None):
-    # Get user profile for personalization
-    profile = get_profile()
+def generate_fallback_response(message, history=None, profile=None):
+    # Get user profile for personalization (callers may pass a snapshot instead)
+    if profile is None:
+        profile = get_profile()
     user_name = profile.get("name", "")
     
     # Personalized greeting if name is available
@@ -496,48 +309,42 @@ def generate_fallback_response(message, history=None):
     
     return random.choice(default_responses)
 
-# Generate response using Mistral model and RAG when available, or fallback
-def generate_response(message, history=None):
-    try:
-        # Log attempt to generate response
-        logger.info(f"Generating response for message: {message[:30]}...")
-        
-        # Check if model is loaded
-        if model is None or tokenizer is None:
-            logger.warning("Model not loaded, using fallback response generator")
-            return generate_fallback_response(message, history)
+# Retrieve relevant context from the vector store for a message
+def retrieve_context(message):
+    rag_context = ""
+    if vector_store is not None:
+        try:
+            results = vector_store.similarity_search(message, k=2)
+            if results:
+                rag_context = "\n\n".join([doc.page_content for doc in results])
+        except Exception as e:
+            logger.error(f"Error in RAG retrieval: {str(e)}")
+    return rag_context
 
-        # Get relevant context from RAG
-        rag_context = ""
-        if vector_store is not None:
-            try:
-                results = vector_store.similarity_search(message, k=2)
-                if results:
-                    rag_context = "\n\n".join([doc.page_content for doc in results])
-            except Exception as e:
-                logger.error(f"Error in RAG retrieval: {str(e)}")
-        
-        # Prepare profile context
+# Build the system prompt from RAG context, profile and conversation history
+def build_system_prompt(message, history=None, profile=None, rag_context=""):
+    # Prepare profile context
+    if profile is None:
         profile = get_profile()
-        profile_context = ""
-        if profile and profile.get("name"):
-            profile_context += f"User's name: {profile.get('name')}\n"
-        if profile and profile.get("feelingToday"):
-            profile_context += f"User's recent feeling: {profile.get('feelingToday')}\n"
-        if profile and profile.get("sleepQuality"):
-            profile_context += f"User's sleep quality: {profile.get('sleepQuality')}\n"
-        if profile and profile.get("stressLevel"):
-            profile_context += f"User's stress level: {profile.get('stressLevel')}\n"
-
-        # Create conversation history context
-        history_context = ""
-        if history and len(history) > 0:
-            for msg in history:
-                sender = "User" if msg.get("sender") == "user" else "Assistant"
-                history_context += f"{sender}: {msg.get('content', '')}\n"
-
-        # Create system prompt with all context
-        system_prompt = f"""You are MindfulAI, a compassionate mental health assistant.
+    profile_context = ""
+    if profile and profile.get("name"):
+        profile_context += f"User's name: {profile.get('name')}\n"
+    if profile and profile.get("feelingToday"):
+        profile_context += f"User's recent feeling: {profile.get('feelingToday')}\n"
+    if profile and profile.get("sleepQuality"):
+        profile_context += f"User's sleep quality: {profile.get('sleepQuality')}\n"
+    if profile and profile.get("stressLevel"):
+        profile_context += f"User's stress level: {profile.get('stressLevel')}\n"
+
+    # Create conversation history context
+    history_context = ""
+    if history and len(history) > 0:
+        for msg in history:
+            sender = "User" if msg.get("sender") == "user" else "Assistant"
+            history_context += f"{sender}: {msg.get('content', '')}\n"
+
+    # Create system prompt with all context
+    return f"""You are MindfulAI, a compassionate mental health assistant.
 Your goal is to provide supportive, evidence-based responses to help users with their mental wellness.
 Be empathetic, non-judgmental, and focus on active listening and validation.
 Never provide medical diagnoses or replace professional mental health care.
@@ -562,6 +369,28 @@ When responding to the user:
 User message: {message}
 """
 
+# Sometimes the model outputs role prefixes in its response, remove them
+def clean_model_response(response):
+    response = response.strip()
+    if response.startswith("Assistant:"):
+        response = response[len("Assistant:"):].strip()
+    return response
+
+# Generate response using Mistral model and RAG when available, or fallback
+def generate_response(message, history=None, profile=None):
+    try:
+        # Log attempt to generate response
+        logger.info(f"Generating response for message: {message[:30]}...")
+        
+        # Check if model is loaded
+        if model is None or tokenizer is None:
+            logger.warning("Model not loaded, using fallback response generator")
+            return generate_fallback_response(message, history, profile)
+
+        # Get relevant context from RAG
+        rag_context = retrieve_context(message)
+        system_prompt = build_system_prompt(message, history, profile, rag_context)
+
         # Generate response
         messages = [{"role": "system", "content": system_prompt}]
         input_ids = tokenizer.apply_chat_template(messages, return_tensors="pt").to(device)
@@ -576,11 +405,7 @@ User message: {message}
                 pad_token_id=tokenizer.eos_token_id
             )
         
-        response = tokenizer.decode(outputs[0][input_ids.shape[1]:], skip_special_tokens=True).strip()
-        
-        # Sometimes the model outputs role prefixes in its response, remove them
-        if response.startswith("Assistant:"):
-            response = response[len("Assistant:"):].strip()
+        response = clean_model_response(tokenizer.decode(outputs[0][input_ids.shape[1]:], skip_special_tokens=True))
         
         logger.info("Generated response successfully using model")
         return response
@@ -588,7 +413,68 @@ User message: {message}
     except Exception as e:
         logger.error(f"Error generating model response: {str(e)}")
         logger.info("Falling back to rule-based response generator")
-        return generate_fallback_response(message, history)
+        return generate_fallback_response(message, history, profile)
+
+# Rule-based responses for a batch, as (response, "fallback") tuples. With seeds, each
+# message reseeds random first, so its fallback text does not depend on batch composition.
+def generate_fallback_responses(items, seeds=None):
+    responses = []
+    for index, (message, history, profile) in enumerate(items):
+        if seeds is not None:
+            random.seed(seeds[index])
+        responses.append((generate_fallback_response(message, history, profile), "fallback"))
+    return responses
+
+# Generate responses for several messages in a single padded model.generate call.
+# Each item is a (message, history, profile) tuple; used by the offline batch replay CLI.
+# Returns (response, source) tuples, where source is "model" or "fallback".
+# Optional per-item seeds make fallback responses reproducible.
+def generate_responses(items, seeds=None):
+    if not items:
+        return []
+    try:
+        logger.info(f"Generating responses for batch of {len(items)} messages")
+
+        if model is None or tokenizer is None:
+            logger.warning("Model not loaded, using fallback response generator")
+            return generate_fallback_responses(items, seeds)
+
+        prompts = []
+        for message, history, profile in items:
+            rag_context = retrieve_context(message)
+            system_prompt = build_system_prompt(message, history, profile, rag_context)
+            messages = [{"role": "system", "content": system_prompt}]
+            prompts.append(tokenizer.apply_chat_template(messages, tokenize=False))
+
+        # Left padding keeps every prompt flush against its generated continuation
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False).to(device)
+
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs,
+                max_new_tokens=512,
+                do_sample=True,
+                top_p=0.9,
+                temperature=0.7,
+                pad_token_id=tokenizer.pad_token_id
+            )
+
+        prompt_length = inputs["input_ids"].shape[1]
+        responses = [
+            (clean_model_response(tokenizer.decode(output[prompt_length:], skip_special_tokens=True)), "model")
+            for output in outputs
+        ]
+
+        logger.info("Generated batch responses successfully using model")
+        return responses
+
+    except Exception as e:
+        logger.error(f"Error generating batch model responses: {str(e)}")
+        logger.info("Falling back to rule-based response generator")
+        return generate_fallback_responses(items, seeds)
 
 # API routes
 @app.route('/api/chat', methods=['POST'])
@@ -666,6 +552,7 @@ def health_check():
         "model": model_status,
         "tokenizer": tokenizer_status,
         "vector_store": vector_store_status,
+        "embedding_backend": embedding_backend or "not loaded",
         "fallback_available": True
     }
     
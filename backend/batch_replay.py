@@ -0,0 +1,394 @@
+# batch_replay.py
+"""Offline bulk conversation replay.
+
+Reads recorded user messages from a JSONL file and runs each one through
+``extract_user_info`` and ``generate_response`` (batched through
+``generate_responses``) across a process pool, streaming results to an output
+JSONL file. The live ``profile.json`` is never read or written: every record
+is answered against its own profile snapshot. The vector store is built (or
+verified) once in the parent process; workers import ``app`` in read-only
+mode and only load it.
+
+Input lines look like::
+
+    {"id": "abc", "message": "...", "history": [...], "profile": {...}}
+
+Only ``message`` is required. ``id`` must be a unique string or integer;
+records without one are keyed as ``line:<n>``. The output file doubles as the checkpoint: re-running with the
+same ``--output`` skips every id already written there.
+
+Example:
+    python batch_replay.py --input replay.jsonl --output results.jsonl --workers 4 --batch-size 8
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from config import EMBEDDING_BACKEND, EMBEDDING_THREADS, ONNX_DIR, READ_ONLY_ENV
+from metrics import percentile
+
+logger = logging.getLogger("batch_replay")
+
+# Per-worker state, populated by init_worker in each pool process
+worker_app = None
+worker_seed = None
+
+
+def init_worker(seed, threads_per_worker):
+    """Import the backend once per worker process (loads the model and the read-only vector store)."""
+    global worker_app, worker_seed
+    import app as backend_app
+
+    worker_app = backend_app
+    worker_seed = seed
+    if threads_per_worker:
+        try:
+            import torch
+            torch.set_num_threads(threads_per_worker)
+        except ImportError:
+            pass
+
+
+def run_batch(records, default_profile):
+    """Process one batch of input records inside a worker; returns output records."""
+    seeds = None
+    if worker_seed is not None:
+        # Seeds derive from record ids, not batch position, so a resumed run that
+        # regroups the remaining records still gives each record the same fallback text
+        seeds = [f"{worker_seed}:{record['id']}" for record in records]
+        try:
+            import torch
+            batch_key = "\n".join(seeds)
+            torch.manual_seed(zlib.crc32(batch_key.encode("utf-8")))
+        except ImportError:
+            pass
+
+    start = time.perf_counter()
+    items = []
+    profile_updates = []
+    for record in records:
+        message = record.get("message", "")
+        history = record.get("history") or []
+        profile = record.get("profile")
+        if profile is None:
+            profile = default_profile
+        profile_updates.append(worker_app.extract_user_info(message))
+        items.append((message, history, profile))
+
+    responses = worker_app.generate_responses(items, seeds)
+    batch_latency_ms = (time.perf_counter() - start) * 1000
+    # The batch is answered in one call, so per-message latency is its share of the batch time
+    latency_ms = batch_latency_ms / len(records)
+
+    results = []
+    for record, (response, source), user_info in zip(records, responses, profile_updates):
+        results.append({
+            "id": record["id"],
+            "message": record.get("message", ""),
+            "response": response,
+            "source": source,
+            "profile_updates": user_info,
+            "latency_ms": round(latency_ms, 3),
+            "batch_latency_ms": round(batch_latency_ms, 3),
+            "batch_size": len(records)
+        })
+    return results
+
+
+def prepare_vector_store():
+    """Build or verify the vector store (and any ONNX export) once, before workers start."""
+    try:
+        from query_embeddings import create_embeddings
+        from vector_store import get_vector_store
+
+        embeddings, backend = create_embeddings(
+            EMBEDDING_BACKEND,
+            cache_size=0,
+            onnx_dir=ONNX_DIR,
+            num_threads=EMBEDDING_THREADS
+        )
+        get_vector_store(embeddings, backend=backend)
+        logger.info("Vector store ready for replay workers")
+    except Exception as e:
+        logger.error(f"Error preparing vector store, workers will run without RAG context: {str(e)}")
+
+
+def read_input(path):
+    """Yield input records, assigning ``line:<n>`` ids where none are given.
+
+    Lines with a null or non-scalar id, an id already seen in this file, a
+    non-object ``profile`` or a ``history`` that is not a list of objects are
+    logged and skipped.
+    """
+    seen_ids = set()
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping malformed input line {line_number}: {e}")
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get("message"), str):
+                logger.error(f"Skipping input line {line_number}: missing 'message'")
+                continue
+            profile = record.get("profile")
+            if profile is not None and not isinstance(profile, dict):
+                logger.error(f"Skipping input line {line_number}: 'profile' must be an object or null")
+                continue
+            history = record.get("history")
+            if history is not None and not (isinstance(history, list) and all(isinstance(msg, dict) for msg in history)):
+                logger.error(f"Skipping input line {line_number}: 'history' must be a list of objects or null")
+                continue
+            if "id" not in record:
+                # Generated ids live in their own namespace so they cannot collide with explicit ones
+                record["id"] = f"line:{line_number}"
+            elif isinstance(record["id"], bool) or not isinstance(record["id"], (str, int)):
+                logger.error(f"Skipping input line {line_number}: 'id' must be a string or integer")
+                continue
+            else:
+                record["id"] = str(record["id"])
+            if record["id"] in seen_ids:
+                logger.error(f"Skipping input line {line_number}: duplicate id '{record['id']}'")
+                continue
+            seen_ids.add(record["id"])
+            yield record
+
+
+def load_checkpoint(path):
+    """Return ids already present in the output file.
+
+    Only an unterminated final line (cut off by an interrupted run) is
+    truncated, so appended results start on a clean line. Complete lines that
+    cannot be parsed are logged and left in place; records after them still count.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        for line_number, raw in enumerate(f, start=1):
+            if not raw.endswith(b"\n"):
+                # Only the last line can lack a newline
+                break
+            valid_bytes += len(raw)
+            try:
+                done.add(str(json.loads(raw)["id"]))
+            except (ValueError, KeyError, TypeError):
+                logger.error(f"Ignoring malformed checkpoint line {line_number} in {path}")
+
+    if valid_bytes < os.path.getsize(path):
+        logger.warning(f"Truncating incomplete final line of {path} at byte {valid_bytes}")
+        with open(path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return done
+
+
+def iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def summarize(latencies, batch_latencies, processed, fallback, failed, skipped, elapsed, aborted=False):
+    latencies = sorted(latencies)
+    batch_latencies = sorted(batch_latencies)
+    return {
+        "processed": processed,
+        "fallback": fallback,
+        "failed": failed,
+        "skipped_from_checkpoint": skipped,
+        "aborted": aborted,
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_second": round(processed / elapsed, 3) if elapsed > 0 else 0.0,
+        "batches": len(batch_latencies),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0
+        },
+        "batch_latency_ms": {
+            "p50": percentile(batch_latencies, 50),
+            "p99": percentile(batch_latencies, 99)
+        }
+    }
+
+
+def replay(args):
+    default_profile = {}
+    if args.profile:
+        with open(args.profile, 'r') as f:
+            default_profile = json.load(f)
+        if not isinstance(default_profile, dict):
+            raise ValueError(f"Profile snapshot {args.profile} must contain a JSON object")
+
+    done = load_checkpoint(args.output)
+    if done:
+        logger.info(f"Resuming: {len(done)} records already in {args.output}")
+
+    prepare_vector_store()
+
+    skipped = 0
+
+    def pending_records():
+        nonlocal skipped
+        for record in read_input(args.input):
+            if record["id"] in done:
+                skipped += 1
+                continue
+            yield record
+
+    latencies = []
+    batch_latencies = []
+    processed = 0
+    fallback = 0
+    failed = 0
+    broken = False
+    max_in_flight = args.workers * 2
+    start = time.perf_counter()
+
+    # Workers inherit the environment, so every worker imports app read-only
+    previous_read_only = os.environ.get(READ_ONLY_ENV)
+    os.environ[READ_ONLY_ENV] = "1"
+
+    # spawn keeps torch/tokenizer thread pools out of forked children
+    context = multiprocessing.get_context("spawn")
+    try:
+        with open(args.output, 'a') as out, ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(args.seed, args.threads_per_worker)
+        ) as pool:
+            batches = iter_batches(pending_records(), args.batch_size)
+            in_flight = {}
+            exhausted = False
+
+            while in_flight or not (exhausted or broken):
+                # Keep a bounded number of batches queued so input is streamed, not preloaded
+                while not (exhausted or broken) and len(in_flight) < max_in_flight:
+                    try:
+                        batch = next(batches)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    try:
+                        future = pool.submit(run_batch, batch, default_profile)
+                    except BrokenProcessPool as e:
+                        broken = True
+                        failed += len(batch)
+                        logger.error(f"Worker pool is broken, stopping submission: {str(e)}")
+                        break
+                    in_flight[future] = batch
+                if not in_flight:
+                    break
+
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    batch = in_flight.pop(future)
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool as e:
+                        # A worker died (e.g. OOM kill) or failed to import the backend;
+                        # every other in-flight batch fails the same way
+                        broken = True
+                        failed += len(batch)
+                        logger.error(f"Batch of {len(batch)} records lost to a broken worker pool: {str(e)}")
+                        continue
+                    except Exception as e:
+                        # Failed records are not written, so a later resume retries them
+                        failed += len(batch)
+                        logger.error(f"Batch of {len(batch)} records failed: {str(e)}")
+                        continue
+
+                    if args.require_model:
+                        # Fallback answers are failures here: left out of the checkpoint so a resume retries them
+                        fallback_results = [result for result in results if result["source"] == "fallback"]
+                        if fallback_results:
+                            failed += len(fallback_results)
+                            logger.error(f"{len(fallback_results)} records fell back to rule-based responses")
+                            results = [result for result in results if result["source"] != "fallback"]
+                            if not results:
+                                continue
+
+                    for result in results:
+                        if result["source"] == "fallback":
+                            fallback += 1
+                        out.write(json.dumps(result) + "\n")
+                        latencies.append(result["latency_ms"])
+                    out.flush()
+                    batch_latencies.append(results[0]["batch_latency_ms"])
+                    processed += len(results)
+
+                    if processed % args.log_every < len(results):
+                        elapsed = time.perf_counter() - start
+                        logger.info(f"Processed {processed} records ({processed / elapsed:.2f} msg/s)")
+
+            if broken:
+                # Count the records that were never submitted; a re-run resumes from the checkpoint
+                remaining = sum(len(batch) for batch in batches)
+                failed += remaining
+                logger.error(f"Replay aborted: {remaining} records were not submitted, re-run to resume")
+    finally:
+        if previous_read_only is None:
+            del os.environ[READ_ONLY_ENV]
+        else:
+            os.environ[READ_ONLY_ENV] = previous_read_only
+
+    summary = summarize(latencies, batch_latencies, processed, fallback, failed, skipped, time.perf_counter() - start, broken)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded chat messages through the backend offline.")
+    parser.add_argument("--input", required=True, help="JSONL file of records with 'message' and optional 'id', 'history', 'profile'")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to; also used as the resume checkpoint")
+    parser.add_argument("--summary", help="Optional path to write the throughput/latency summary as JSON")
+    parser.add_argument("--profile", help="Profile snapshot JSON used for records without their own 'profile' (default: empty profile)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes; each loads its own copy of the model (default: 1)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Messages per model.generate call (default: 8)")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="torch intra-op threads per worker; 0 keeps the torch default")
+    parser.add_argument("--seed", type=int, help="Seed randomness from record ids: fallback responses are reproducible per record; model sampling only for identical batches")
+    parser.add_argument("--require-model", action="store_true", help="Treat rule-based fallback responses as failures; they are not written or checkpointed")
+    parser.add_argument("--log-every", type=int, default=1000, help="Log progress every N processed records (default: 1000)")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.batch_size < 1 or args.log_every < 1:
+        parser.error("--workers, --batch-size and --log-every must be positive")
+    return args
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args = parse_args(argv)
+    summary = replay(args)
+    logger.info(f"Replay finished: {summary['processed']} processed ({summary['fallback']} fallback), {summary['failed']} failed, "
+                f"{summary['messages_per_second']} msg/s, p99 {summary['latency_ms']['p99']} ms")
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# benchmark_embeddings.py
+"""Benchmark query-embedding backends and check parity with the torch backend.
+
+For each backend this reports single-query embeddings/sec with p50/p99 latency,
+batched embeddings/sec, and the cosine similarity of its query vectors against
+the current ``torch`` (HuggingFaceEmbeddings) backend. It also reports the
+same figures for the float16 LRU query cache. The app itself is not imported,
+so the chat model is never loaded.
+
+Example:
+    python benchmark_embeddings.py --backends torch onnx torchscript --repeat 500 --threads 4
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from metrics import percentile
+from query_embeddings import BACKENDS, CachedQueryEmbeddings, is_uncased, load_backend
+
+logger = logging.getLogger("benchmark_embeddings")
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(__file__), "data", "onnx")
+
+SAMPLE_QUERIES = [
+    "I've been feeling really stressed lately.",
+    "I can't sleep at night and I'm always tired.",
+    "How do I deal with anxiety before exams?",
+    "I feel hopeless and unmotivated most days.",
+    "What are some mindfulness exercises I can try?",
+    "My heart races and I start panicking at work.",
+    "Hi, my name is Sam.",
+    "I've been feeling a bit down since last week.",
+    "Is it normal to feel overwhelmed all the time?",
+    "Can you suggest a bedtime routine?",
+    "I had a fight with my friend and I feel terrible.",
+    "What should I do if I'm having thoughts of self-harm?",
+    "Thank you, that was helpful.",
+    "How can I stop overthinking everything?",
+    "I get headaches when I'm stressed.",
+    "I want to find a therapist but don't know where to start."
+]
+
+
+def cosine_similarities(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return (a * b).sum(axis=1) / np.clip(norms, 1e-12, None)
+
+
+def time_queries(embeddings, queries):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "embeddings_per_second": round(len(queries) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3)
+    }
+
+
+def parity(vectors, reference):
+    similarities = cosine_similarities(vectors, reference)
+    return {
+        "min_cosine": round(float(similarities.min()), 6),
+        "mean_cosine": round(float(similarities.mean()), 6)
+    }
+
+
+def benchmark_backend(embeddings, queries, workload, reference, warmup):
+    for query in queries[:warmup]:
+        embeddings.embed_query(query)
+
+    result = {"single_query": time_queries(embeddings, workload)}
+
+    start = time.perf_counter()
+    embeddings.embed_documents(workload)
+    elapsed = time.perf_counter() - start
+    result["batched_embeddings_per_second"] = round(len(workload) / elapsed, 2) if elapsed > 0 else 0.0
+
+    vectors = [embeddings.embed_query(query) for query in queries]
+    if reference is not None:
+        result["parity_vs_torch"] = parity(vectors, reference)
+
+    # Cached path: first pass fills the cache, the timed pass is all hits
+    cached = CachedQueryEmbeddings(embeddings, max_size=len(queries), lowercase=is_uncased(embeddings))
+    cached_vectors = [cached.embed_query(query) for query in queries]
+    result["cached_query"] = time_queries(cached, workload)
+    result["cached_query"]["float16_parity"] = parity(cached_vectors, vectors)
+    result["cached_query"]["cache_info"] = cached.cache_info()
+    return result, vectors
+
+
+def load_queries(path):
+    if not path:
+        return list(SAMPLE_QUERIES)
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends and check parity with the torch backend.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS), help="Backends to benchmark (default: all)")
+    parser.add_argument("--queries", help="Text file with one query per line (default: built-in sample queries)")
+    parser.add_argument("--repeat", type=int, default=200, help="Number of timed queries per backend, cycling through the query set (default: 200)")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed warm-up queries per backend (default: 5)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for onnx, and torch's global thread count for torch/torchscript; 0 keeps the runtime default")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR, help="Where the exported ONNX model is cached")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Fail if any backend's min cosine vs torch falls below this (default: 0.99)")
+    parser.add_argument("--output", help="Optional path to write the results as JSON")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be positive")
+    return args
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args = parse_args(argv)
+    queries = load_queries(args.queries)
+    if not queries:
+        logger.error("No queries to benchmark")
+        return 1
+    workload = [queries[i % len(queries)] for i in range(args.repeat)]
+
+    if args.threads:
+        # Safe here because the benchmark process runs nothing else on torch's global pool
+        import torch
+        torch.set_num_threads(args.threads)
+
+    # The torch backend is the parity reference, so it always runs first
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    results = {}
+    reference = None
+    failed = False
+    for backend in backends:
+        logger.info(f"Benchmarking {backend} backend")
+        try:
+            embeddings = load_backend(backend, onnx_dir=args.onnx_dir, num_threads=args.threads)
+        except Exception as e:
+            logger.error(f"Could not load {backend} backend: {str(e)}")
+            results[backend] = {"error": str(e)}
+            failed = failed or backend == "torch" or backend in args.backends
+            continue
+
+        result, vectors = benchmark_backend(embeddings, queries, workload, reference, args.warmup)
+        if backend == "torch":
+            reference = vectors
+        if backend in args.backends:
+            results[backend] = result
+        if result.get("parity_vs_torch", {}).get("min_cosine", 1.0) < args.min_cosine:
+            logger.error(f"{backend} backend parity below {args.min_cosine}")
+            failed = True
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
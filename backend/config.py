@@ -0,0 +1,20 @@
+# config.py
+import os
+
+# Constants
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+PROFILE_FILE = os.path.join(DATA_DIR, "profile.json")
+RESOURCES_FILE = os.path.join(DATA_DIR, "resources.json")
+KNOWLEDGE_DIR = os.path.join(DATA_DIR, "knowledge")
+DB_DIR = os.path.join(DATA_DIR, "chroma_db")
+ONNX_DIR = os.path.join(DATA_DIR, "onnx")
+
+# Embedding backend selection: "torch" (default), "onnx" or "torchscript"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))
+
+# Set by batch_replay.py for its worker processes: importing app then never writes
+# profile.json or resources.json and only loads an already built vector store
+READ_ONLY_ENV = "MINDFULAI_READ_ONLY"
+READ_ONLY = os.environ.get(READ_ONLY_ENV) == "1"
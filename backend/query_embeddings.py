@@ -0,0 +1,278 @@
+# query_embeddings.py
+"""Selectable CPU embedding backends with a bounded query-embedding cache.
+
+Backends (all produce mean-pooled, L2-normalised all-MiniLM-L6-v2 vectors):
+
+* ``torch``       - LangChain ``HuggingFaceEmbeddings`` on PyTorch eager (original behaviour)
+* ``onnx``        - ONNX Runtime session over an int8 dynamically quantized export
+* ``torchscript`` - int8 dynamically quantized model traced with TorchScript
+
+``create_embeddings`` builds the selected backend (falling back to ``torch``
+if it cannot be initialized) and wraps it in ``CachedQueryEmbeddings`` so a
+resent or retried message is not embedded twice.
+"""
+import logging
+import os
+import threading
+from abc import abstractmethod
+from collections import OrderedDict
+
+import numpy as np
+from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# sentence-transformers truncates this model's inputs at 256 tokens
+MAX_SEQ_LENGTH = 256
+BACKENDS = ("torch", "onnx", "torchscript")
+
+
+def mean_pool(last_hidden_state, attention_mask):
+    """Mean-pool token embeddings over the attention mask and L2-normalise."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.clip(norms, 1e-12, None)
+
+
+class TransformerEmbeddings(Embeddings):
+    """Shared tokenization and pooling for backends that run their own encoder."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=32):
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    @abstractmethod
+    def run(self, encoded):
+        """Return last_hidden_state as a numpy array for a tokenized batch."""
+
+    def encode(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            vectors.append(mean_pool(self.run(encoded), encoded["attention_mask"]))
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(vectors)
+
+    # Newlines are replaced the same way HuggingFaceEmbeddings does, for parity
+    def embed_documents(self, texts):
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text.replace("\n", " ")])[0].tolist()
+
+
+def export_onnx_model(model_name, cache_dir):
+    """Export the encoder to ONNX and quantize it to int8 once; returns the int8 model path."""
+    os.makedirs(cache_dir, exist_ok=True)
+    base_name = model_name.replace("/", "__")
+    fp32_path = os.path.join(cache_dir, f"{base_name}.onnx")
+    int8_path = os.path.join(cache_dir, f"{base_name}.int8.onnx")
+    if os.path.exists(int8_path):
+        return int8_path
+
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    logger.info(f"Exporting {model_name} to ONNX in {cache_dir}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["export sample", "a longer export sample sentence"], padding=True, return_tensors="pt")
+    # Positional order must match BertModel.forward(input_ids, attention_mask, token_type_ids)
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    # Write under per-process names and rename, so concurrent workers never see partial files
+    tmp_fp32_path = f"{fp32_path}.{os.getpid()}.tmp"
+    tmp_int8_path = f"{int8_path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            tmp_fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    quantize_dynamic(tmp_fp32_path, tmp_int8_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_fp32_path, fp32_path)
+    os.replace(tmp_int8_path, int8_path)
+    logger.info(f"Saved int8 ONNX model to {int8_path}")
+    return int8_path
+
+
+class OnnxEmbeddings(TransformerEmbeddings):
+    """int8 ONNX Runtime encoder; the session keeps its intra-op thread pool alive between calls."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, cache_dir="onnx", num_threads=0, batch_size=32):
+        super().__init__(model_name, batch_size)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads  # 0 lets ONNX Runtime pick one thread per core
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            export_onnx_model(model_name, cache_dir),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def run(self, encoded):
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feeds)[0]
+
+
+class TorchScriptEmbeddings(TransformerEmbeddings):
+    """int8 dynamically quantized encoder traced with TorchScript.
+
+    Runs on torch's process-wide intra-op thread pool, shared with the chat
+    model, so it deliberately leaves the global thread count alone.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=32):
+        super().__init__(model_name, batch_size)
+        import torch
+        from transformers import AutoModel
+
+        model = AutoModel.from_pretrained(model_name, torchscript=True)
+        model.eval()
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        sample = self.tokenizer(["trace sample", "a longer trace sample sentence"], padding=True, return_tensors="pt")
+        with torch.no_grad():
+            self.model = torch.jit.trace(
+                model,
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"])
+            )
+        self.torch = torch
+
+    def run(self, encoded):
+        inputs = [
+            self.torch.from_numpy(encoded[name].astype(np.int64))
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+        ]
+        with self.torch.inference_mode():
+            outputs = self.model(*inputs)
+        return outputs[0].numpy()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Bounded LRU cache of query embeddings, stored as float16 vectors.
+
+    Keys are the query text with whitespace collapsed and, when ``lowercase`` is
+    set (only correct for uncased tokenizers such as all-MiniLM-L6-v2's),
+    lowercased; the tokenizer maps all such variants to the same tokens, so
+    they share one entry. The original text is what gets embedded. Document
+    embeddings are passed straight through to the wrapped backend.
+    """
+
+    def __init__(self, embeddings, max_size=1024, lowercase=False):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.lowercase = lowercase
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def normalize(self, text):
+        text = " ".join(text.split())
+        return text.lower() if self.lowercase else text
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = self.normalize(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vector.astype(np.float32).tolist()
+            self.misses += 1
+
+        # Embed outside the lock so concurrent requests for other texts are not serialized
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float16)
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        # Return the stored float16 values so hits and misses give identical vectors
+        return vector.astype(np.float32).tolist()
+
+    def cache_info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.max_size}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def is_uncased(embeddings):
+    """Whether a backend's tokenizer lowercases its input (so cache keys may too)."""
+    tokenizer = getattr(embeddings, "tokenizer", None)
+    if tokenizer is None:
+        # HuggingFaceEmbeddings wraps a SentenceTransformer, which exposes its tokenizer
+        tokenizer = getattr(getattr(embeddings, "client", None), "tokenizer", None)
+    return bool(getattr(tokenizer, "do_lower_case", False))
+
+
+def load_backend(backend, model_name=EMBEDDING_MODEL_NAME, onnx_dir="onnx", num_threads=0):
+    """Instantiate one backend by name without caching or fallback.
+
+    ``num_threads`` only applies to the onnx backend, which owns its thread pool.
+    """
+    if backend == "torch":
+        return HuggingFaceEmbeddings(model_name=model_name)
+    if backend == "onnx":
+        return OnnxEmbeddings(model_name, cache_dir=onnx_dir, num_threads=num_threads)
+    if backend == "torchscript":
+        return TorchScriptEmbeddings(model_name)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+
+def create_embeddings(backend="torch", cache_size=1024, model_name=EMBEDDING_MODEL_NAME, onnx_dir="onnx", num_threads=0):
+    """Build the selected backend behind a query cache, falling back to the torch backend on failure.
+
+    Returns a ``(embeddings, backend_name)`` tuple naming the backend actually in use.
+    """
+    backend = backend.lower()
+    try:
+        logger.info(f"Loading {backend} embedding backend for {model_name}")
+        base = load_backend(backend, model_name, onnx_dir, num_threads)
+    except Exception as e:
+        if backend == "torch":
+            raise
+        logger.error(f"Error loading {backend} embedding backend: {str(e)}")
+        logger.info("Falling back to torch embedding backend")
+        backend = "torch"
+        base = load_backend(backend, model_name)
+
+    if cache_size > 0:
+        return CachedQueryEmbeddings(base, max_size=cache_size, lowercase=is_uncased(base)), backend
+    return base, backend
@@ -0,0 +1,233 @@
+# vector_store.py
+import os
+import shutil
+import logging
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import Chroma
+from langchain.document_loaders import DirectoryLoader, TextLoader
+from config import DB_DIR, KNOWLEDGE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Name of the embedding backend that produced the stored document vectors
+BACKEND_MARKER_FILE = os.path.join(DB_DIR, "embedding_backend.txt")
+
+# Create sample knowledge files for the vector store
+def create_sample_knowledge_files():
+    logger.info("Creating sample knowledge files")
+    sample_files = {
+        "anxiety.txt": """
+Anxiety is a normal and often healthy emotion. However, when a person regularly feels disproportionate levels of anxiety, it might become a medical disorder.
+
+Common anxiety symptoms include:
+- Feeling nervous, restless or tense
+- Having a sense of impending danger, panic or doom
+- Having an increased heart rate
+- Breathing rapidly (hyperventilation)
+- Sweating
+- Trembling
+- Feeling weak or tired
+- Trouble concentrating
+- Having trouble sleeping
+- Experiencing gastrointestinal (GI) problems
+
+Self-help techniques for anxiety:
+1. Deep breathing exercises
+2. Progressive muscle relaxation
+3. Mindfulness meditation
+4. Regular physical exercise
+5. Adequate sleep
+6. Limiting caffeine and alcohol
+7. Maintaining a healthy diet
+8. Journaling
+9. Social connection and support
+        """,
+        "depression.txt": """
+Depression is a common and serious medical illness that negatively affects how you feel, think, and act. It causes feelings of sadness and/or a loss of interest in activities you once enjoyed.
+
+Common symptoms of depression include:
+- Feeling sad or having a depressed mood
+- Loss of interest or pleasure in activities once enjoyed
+- Changes in appetite (weight loss or gain)
+- Trouble sleeping or sleeping too much
+- Loss of energy or increased fatigue
+- Increase in purposeless physical activity or slowed movements
+- Feeling worthless or guilty
+- Difficulty thinking, concentrating or making decisions
+- Thoughts of death or suicide
+
+Self-help strategies for depression:
+1. Set attainable goals
+2. Engage in activities that may make you feel better
+3. Exercise regularly
+4. Try to spend time with others
+5. Postpone important decisions until depression improves
+6. Discuss decisions with trusted friends or family
+7. Expect your mood to improve gradually, not immediately
+8. Develop a routine, especially for sleep
+9. Continue educating yourself about depression
+        """,
+        "stress_management.txt": """
+Stress management refers to techniques and psychotherapies aimed at controlling a person's level of stress for improving everyday functioning.
+
+Effects of chronic stress:
+- Anxiety
+- Depression
+- Digestive problems
+- Headaches
+- Heart disease
+- Sleep problems
+- Weight gain
+- Memory and concentration impairment
+
+Effective stress management techniques:
+1. Physical activity (30 minutes of exercise most days)
+2. Relaxation techniques (deep breathing, meditation, yoga, tai chi)
+3. Connecting with others (social support)
+4. Time management strategies
+5. Setting boundaries
+6. Practicing self-care
+7. Getting enough sleep
+8. Seeking professional help when needed
+9. Keeping a stress diary to identify stressors
+        """,
+        "sleep_hygiene.txt": """
+Sleep hygiene refers to the habits and practices that are conducive to sleeping well on a regular basis.
+
+Good sleep hygiene practices:
+1. Maintain a consistent sleep schedule (go to bed and wake up at the same time)
+2. Create a relaxing bedtime routine
+3. Ensure your bedroom is quiet, dark, and cool
+4. Use a comfortable mattress and pillows
+5. Limit exposure to screens before bedtime
+6. Avoid caffeine, alcohol, and large meals close to bedtime
+7. Regular physical activity during the day
+8. Manage worries (journaling before bed can help)
+9. Limit daytime naps to 20-30 minutes
+
+Poor sleep can contribute to:
+- Decreased cognitive function
+- Mood disturbances
+- Increased risk of accidents
+- Weakened immune system
+- Higher risk of health problems like heart disease and diabetes
+        """,
+        "mindfulness.txt": """
+Mindfulness is the psychological process of bringing one's attention to experiences occurring in the present moment, which can be developed through meditation and other training.
+
+Benefits of mindfulness practice:
+- Reduced stress and anxiety
+- Improved focus and attention
+- Better emotional regulation
+- Enhanced self-awareness
+- Improved relationship satisfaction
+- Increased immune functioning
+- Reduced rumination
+- Improved memory and cognitive flexibility
+
+Mindfulness techniques:
+1. Mindful breathing: Focus on the sensation of breath entering and leaving the body
+2. Body scan meditation: Systematically focus attention on different parts of the body
+3. Mindful eating: Pay close attention to the sensory experience of eating
+4. Walking meditation: Bring awareness to each step and breath while walking
+5. Mindful observation: Choose an object and focus on observing it for a few minutes
+6. Mindful listening: Close your eyes and notice all the sounds around you
+7. Thought labeling: Observe thoughts as they arise and label them
+        """,
+        "crisis_resources.txt": """
+Crisis Resources for Mental Health Emergencies:
+
+1. 988 Suicide & Crisis Lifeline
+   - Call or text 988
+   - Available 24/7
+   - Provides free and confidential support for people in distress
+
+2. Crisis Text Line
+   - Text HOME to 741741
+   - Available 24/7
+   - Trained crisis counselors provide support via text message
+
+3. Emergency Services
+   - Call 911 for immediate emergencies
+   - Go to the nearest emergency room
+   - Contact local urgent psychiatric care services
+
+Warning signs that indicate someone may need immediate help:
+- Talking about wanting to die or kill oneself
+- Looking for ways to kill oneself
+- Talking about feeling hopeless or having no purpose
+- Talking about feeling trapped or being in unbearable pain
+- Talking about being a burden to others
+- Increasing alcohol or drug use
+- Acting anxious, agitated, or reckless
+- Sleeping too little or too much
+- Withdrawing or feeling isolated
+- Showing rage or talking about seeking revenge
+- Displaying extreme mood swings
+        """
+    }
+    
+    for filename, content in sample_files.items():
+        file_path = os.path.join(KNOWLEDGE_DIR, filename)
+        with open(file_path, 'w') as file:
+            file.write(content)
+    
+    logger.info(f"Created {len(sample_files)} sample knowledge files")
+
+# Stores built before this marker existed were embedded with the (then only) torch backend
+def get_store_backend():
+    if not os.path.exists(BACKEND_MARKER_FILE):
+        return "torch"
+    with open(BACKEND_MARKER_FILE, 'r') as f:
+        return f.read().strip()
+
+# Initialize or load the vector store. With read_only the store must already exist;
+# batch replay builds it once in the parent so workers never write to DB_DIR concurrently
+def get_vector_store(embeddings, read_only=False, backend="torch"):
+    if os.path.exists(DB_DIR) and len(os.listdir(DB_DIR)) > 0:
+        store_backend = get_store_backend()
+        if store_backend != backend:
+            # Document vectors from one backend searched with query vectors from another drift apart
+            if read_only:
+                logger.warning(f"Vector store was embedded with the {store_backend} backend but queries use {backend}")
+            else:
+                logger.warning(f"Vector store was embedded with the {store_backend} backend, rebuilding it for {backend}")
+                shutil.rmtree(DB_DIR)
+                return build_vector_store(embeddings, backend)
+        # Load existing vector store
+        logger.info("Loading existing vector store")
+        return Chroma(persist_directory=DB_DIR, embedding_function=embeddings)
+    elif read_only:
+        raise RuntimeError(f"Vector store in {DB_DIR} has not been built")
+    else:
+        return build_vector_store(embeddings, backend)
+
+# Initialize and populate vector store with mental health resources
+def build_vector_store(embeddings, backend):
+    logger.info("Initializing new vector store")
+    os.makedirs(DB_DIR, exist_ok=True)
+    os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
+    if not os.path.exists(KNOWLEDGE_DIR) or len(os.listdir(KNOWLEDGE_DIR)) == 0:
+        # Create sample knowledge files if directory is empty
+        create_sample_knowledge_files()
+    
+    # Load documents
+    loader = DirectoryLoader(KNOWLEDGE_DIR, glob="**/*.txt", loader_cls=TextLoader)
+    documents = loader.load()
+    
+    # Split text into chunks
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = text_splitter.split_documents(documents)
+    
+    # Create vector store
+    vectorstore = Chroma.from_documents(
+        documents=chunks,
+        embedding=embeddings, 
+        persist_directory=DB_DIR
+    )
+    vectorstore.persist()
+
+    # Record which backend embedded the documents, written last so it implies a complete store
+    with open(BACKEND_MARKER_FILE, 'w') as f:
+        f.write(backend)
+    return vectorstore